@@ -0,0 +1,110 @@
+import hashlib
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+EmbedFn = Callable[[str], Awaitable[List[float]]]
+
+
+class SemanticCache:
+    """In-process cache of LLM responses keyed by prompt similarity.
+
+    Lookups try an exact SHA256 match on the normalized prompt first and fall
+    back to a cosine-similarity search over the stored prompt embeddings.
+    Entries are shared by every caller, so only prompts whose answer does not
+    depend on earlier conversation should be looked up or stored.
+
+    Similarity matching is limited to prompts of at most ``max_semantic_chars``
+    characters. Longer prompts tend to carry the asker's specifics (retailer,
+    amount, location), and the answer echoes them back, so those prompts only
+    ever hit on an exact match.
+
+    Entries live in fixed slots of a preallocated ``max_entries x dim`` matrix
+    and are overwritten oldest-first once the cache is full.
+    """
+
+    def __init__(
+        self,
+        embed: EmbedFn,
+        threshold: float = 0.95,
+        max_entries: int = 2048,
+        max_semantic_chars: int = 200
+    ):
+        self.embed = embed
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_semantic_chars = max_semantic_chars
+        self._slots: Dict[str, int] = {}
+        self._slot_keys: List[Optional[str]] = [None] * max_entries
+        self._responses: List[Optional[str]] = [None] * max_entries
+        self._vectors: Optional[np.ndarray] = None
+        self._size = 0
+        self._next = 0
+
+    @staticmethod
+    def cache_key(text: str) -> str:
+        return hashlib.sha256(" ".join(text.lower().split()).encode("utf-8")).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    async def lookup(self, text: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """Return ``(response, embedding)``; ``response`` is None on a miss.
+
+        The embedding is handed back so a miss can be stored with ``put``
+        without embedding the prompt twice. It is None for exact hits, for
+        prompts too long for similarity matching and when the embedding call
+        fails.
+        """
+        slot = self._slots.get(self.cache_key(text))
+        if slot is not None:
+            return self._responses[slot], None
+        if len(text) > self.max_semantic_chars:
+            return None, None
+
+        try:
+            embedding = np.asarray(await self.embed(text), dtype=np.float32)
+        except Exception as e:
+            logger.warning("Semantic cache embedding failed: %s", e)
+            return None, None
+        norm = np.linalg.norm(embedding)
+        if norm == 0:
+            return None, None
+        embedding /= norm
+
+        if self._vectors is not None and self._size:
+            # Slots stored without an embedding are zero rows and never match
+            scores = self._vectors[:self._size] @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                return self._responses[best], embedding
+        return None, embedding
+
+    async def put(self, text: str, embedding: Optional[np.ndarray], response: str) -> None:
+        if not response:
+            return
+        key = self.cache_key(text)
+        slot = self._slots.get(key)
+        if slot is not None:
+            self._responses[slot] = response
+            return
+
+        if embedding is not None and self._vectors is None:
+            self._vectors = np.zeros((self.max_entries, embedding.shape[0]), dtype=np.float32)
+
+        slot = self._next
+        evicted = self._slot_keys[slot]
+        if evicted is not None:
+            del self._slots[evicted]
+        self._slots[key] = slot
+        self._slot_keys[slot] = key
+        self._responses[slot] = response
+        if self._vectors is not None:
+            self._vectors[slot] = 0 if embedding is None else embedding
+
+        self._next = (slot + 1) % self.max_entries
+        self._size = max(self._size, slot + 1)
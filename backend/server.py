@@ -1,27 +1,83 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, Response
 from dotenv import load_dotenv
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import WriteConcern
 import os
+import asyncio
+import orjson
 import logging
+from collections import defaultdict
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List
+from typing import AsyncIterator, List, Optional
 import uuid
 from datetime import datetime, timezone
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+from google import genai
+from google.genai import types
+from semantic_cache import SemanticCache
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', '50')),
+    minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', '5')),
+    maxIdleTimeMS=30000,
+    serverSelectionTimeoutMS=5000,
+    waitQueueTimeoutMS=10000,
+    retryWrites=True,
+    # Timestamps are stored as native BSON dates; read them back as aware UTC
+    tz_aware=True
+)
 db = client[os.environ['DB_NAME']]
 
+# Chat log inserts only need a primary ack
+chat_log_writes = db.chat_messages.with_options(write_concern=WriteConcern(w=1))
+
+# Serves both the session filter and the timestamp sort of history reads.
+# BSON dates only keep milliseconds, so _id (generated client-side in insert
+# order) breaks ties between the user and assistant halves of a turn.
+CHAT_HISTORY_INDEX = [("session_id", 1), ("timestamp", 1), ("_id", 1)]
+CHAT_HISTORY_ORDER = [("timestamp", 1), ("_id", 1)]
+CHAT_HISTORY_ORDER_DESC = [("timestamp", -1), ("_id", -1)]
+CHAT_MESSAGE_PROJECTION = {"_id": 0, "id": 1, "session_id": 1, "role": 1, "message": 1, "timestamp": 1}
+
+# Gemini configuration, read once at import
+GEMINI_API_KEY = os.environ['GEMINI_API_KEY']
+GEMINI_MODEL = "gemini-2.5-pro"
+EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL', 'text-embedding-004')
+
+# One shared Gemini client, reused by every request for chat and embeddings
+genai_client = genai.Client(api_key=GEMINI_API_KEY)
+
+async def embed_text(text: str) -> List[float]:
+    result = await genai_client.aio.models.embed_content(
+        model=EMBEDDING_MODEL,
+        contents=text
+    )
+    return result.embeddings[0].values
+
+response_cache = SemanticCache(
+    embed=embed_text,
+    threshold=float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.95')),
+    max_semantic_chars=int(os.environ.get('SEMANTIC_CACHE_MAX_CHARS', '200'))
+)
+
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -31,7 +87,7 @@ api_router = APIRouter(prefix="/api")
 class ChatMessage(BaseModel):
     model_config = ConfigDict(extra="ignore")
     
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     session_id: str
     role: str  # "user" or "assistant"
     message: str
@@ -61,6 +117,106 @@ Your role is to:
 Always provide thorough, accurate information while being clear that you're providing general legal information, 
 not personalized legal advice. Answer every question the user asks related to consumer protection."""
 
+# Serialize turns within a session and cap concurrent Gemini calls overall
+_session_locks: "defaultdict[str, asyncio.Semaphore]" = defaultdict(lambda: asyncio.Semaphore(1))
+_llm_semaphore = asyncio.Semaphore(int(os.environ.get('LLM_CONCURRENCY', '32')))
+
+async def evict_idle_session_locks():
+    while True:
+        await asyncio.sleep(60)
+        for session_id in [sid for sid, lock in _session_locks.items() if not lock.locked()]:
+            del _session_locks[session_id]
+
+MAX_MESSAGE_CHARS = 8000
+
+def clean_message(message: str) -> str:
+    message = message.strip()
+    if not message:
+        raise HTTPException(status_code=422, detail="Message must not be empty")
+    if len(message) > MAX_MESSAGE_CHARS:
+        raise HTTPException(status_code=413, detail=f"Message exceeds {MAX_MESSAGE_CHARS} characters")
+    return message
+
+EMPTY_RESPONSE_DETAIL = "The model returned an empty response"
+GEMINI_CONFIG = types.GenerateContentConfig(system_instruction=SYSTEM_MESSAGE)
+
+# Stored conversation replayed into each Gemini call
+CONTEXT_MESSAGES = 20
+CONTEXT_MAX_CHARS = int(os.environ.get('CONTEXT_MAX_CHARS', '24000'))
+
+async def recent_turns(session_id: str) -> List[dict]:
+    """Return the session's last CONTEXT_MESSAGES stored messages, newest first."""
+    return await db.chat_messages.find(
+        {"session_id": session_id},
+        {"_id": 0, "role": 1, "message": 1}
+    ).sort(CHAT_HISTORY_ORDER_DESC).hint(CHAT_HISTORY_INDEX).to_list(CONTEXT_MESSAGES)
+
+def build_contents(last_turns: List[dict], message: str) -> List[types.Content]:
+    """Gemini conversation for a new message, rebuilt from the stored turns.
+
+    Older turns are dropped once CONTEXT_MAX_CHARS of history is used.
+    """
+    contents = []
+    budget = CONTEXT_MAX_CHARS
+    for msg in last_turns:
+        budget -= len(msg['message'])
+        if budget < 0:
+            break
+        contents.append(types.Content(
+            role="model" if msg['role'] == "assistant" else "user",
+            parts=[types.Part(text=msg['message'])]
+        ))
+    contents.reverse()
+    # Gemini expects the conversation to open with a user turn
+    while contents and contents[0].role == "model":
+        contents.pop(0)
+    contents.append(types.Content(role="user", parts=[types.Part(text=message)]))
+    return contents
+
+async def stream_gemini(contents: List[types.Content]) -> AsyncIterator[str]:
+    """Yield Gemini text chunks for ``contents``.
+
+    The model output is read by a separate task into a queue, so the global
+    LLM slot is released as soon as Gemini finishes rather than when a slow
+    client has read the last chunk.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce():
+        try:
+            async with _llm_semaphore:
+                stream = await genai_client.aio.models.generate_content_stream(
+                    model=GEMINI_MODEL,
+                    contents=contents,
+                    config=GEMINI_CONFIG
+                )
+                async for chunk in stream:
+                    if chunk.text:
+                        queue.put_nowait(chunk.text)
+            queue.put_nowait(None)
+        except Exception as e:
+            queue.put_nowait(e)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (item := await queue.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        producer.cancel()
+
+def repeated_answer(last_turns: List[dict], message: str) -> Optional[str]:
+    """Return the last assistant reply if the previous user turn asked the same thing."""
+    if (
+        len(last_turns) >= 2
+        and last_turns[0]['role'] == "assistant"
+        and last_turns[1]['role'] == "user"
+        and last_turns[1]['message'] == message
+    ):
+        return last_turns[0]['message']
+    return None
+
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
@@ -68,73 +224,186 @@ async def root():
 
 @api_router.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
+    message = clean_message(request.message)
     try:
-        # Store user message
-        user_msg = ChatMessage(
-            session_id=request.session_id,
-            role="user",
-            message=request.message
-        )
-        user_doc = user_msg.model_dump()
-        user_doc['timestamp'] = user_doc['timestamp'].isoformat()
-        await db.chat_messages.insert_one(user_doc)
-        
-        # Initialize chat with Gemini
-        chat = LlmChat(
-            api_key=os.environ['GEMINI_API_KEY'],
-            session_id=request.session_id,
-            system_message=SYSTEM_MESSAGE
-        ).with_model("gemini", "gemini-2.5-pro")
-        
-        # Create user message
-        user_message = UserMessage(text=request.message)
-        
-        # Get response from AI
-        ai_response = await chat.send_message(user_message)
-        
-        # Store assistant response
-        assistant_msg = ChatMessage(
-            session_id=request.session_id,
-            role="assistant",
-            message=ai_response
-        )
-        assistant_doc = assistant_msg.model_dump()
-        assistant_doc['timestamp'] = assistant_doc['timestamp'].isoformat()
-        await db.chat_messages.insert_one(assistant_doc)
+        # One turn at a time per session keeps the conversation ordered
+        async with _session_locks[request.session_id]:
+            # Timestamp the user turn only once it holds the session
+            user_msg = ChatMessage(
+                session_id=request.session_id,
+                role="user",
+                message=message
+            )
+            
+            last_turns = await recent_turns(request.session_id)
+            ai_response = repeated_answer(last_turns, message)
+            
+            # The response cache is shared by every session, so it only serves
+            # opening questions; follow-ups depend on the conversation so far
+            use_cache = not last_turns
+            embedding = None
+            if ai_response is None and use_cache:
+                # Serve near-duplicate questions from the cache before calling Gemini
+                ai_response, embedding = await response_cache.lookup(message)
+            
+            if ai_response is None:
+                # Get response from AI
+                async with _llm_semaphore:
+                    result = await genai_client.aio.models.generate_content(
+                        model=GEMINI_MODEL,
+                        contents=build_contents(last_turns, message),
+                        config=GEMINI_CONFIG
+                    )
+                ai_response = result.text
+                if not ai_response:
+                    # Safety blocks and empty candidates carry no text
+                    logger.warning("Empty model response (session %s)", request.session_id)
+                    raise HTTPException(status_code=502, detail=EMPTY_RESPONSE_DETAIL)
+                if use_cache:
+                    await response_cache.put(message, embedding, ai_response)
+            
+            assistant_msg = ChatMessage(
+                session_id=request.session_id,
+                role="assistant",
+                message=ai_response
+            )
+            
+            # Store both turns in a single round-trip
+            await chat_log_writes.insert_many(
+                [user_msg.model_dump(), assistant_msg.model_dump()],
+                ordered=False,
+                bypass_document_validation=True
+            )
         
         return ChatResponse(
             response=ai_response,
             session_id=request.session_id
         )
+    except HTTPException:
+        raise
     except Exception as e:
-        logging.error(f"Chat error: {str(e)}")
+        logger.exception("Chat error (session %s)", request.session_id)
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
+# Keep proxies (nginx, the preview ingress) from buffering the event stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def sse_event(payload: dict) -> str:
+    return f"data: {orjson.dumps(payload).decode()}\n\n"
+
+@api_router.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    message = clean_message(request.message)
+
+    async def generate():
+        try:
+            async with _session_locks[request.session_id]:
+                user_msg = ChatMessage(
+                    session_id=request.session_id,
+                    role="user",
+                    message=message
+                )
+                
+                last_turns = await recent_turns(request.session_id)
+                ai_response = repeated_answer(last_turns, message)
+                
+                use_cache = not last_turns
+                embedding = None
+                if ai_response is None and use_cache:
+                    ai_response, embedding = await response_cache.lookup(message)
+                
+                if ai_response is not None:
+                    yield sse_event({"text": ai_response})
+                else:
+                    chunks = []
+                    async for text in stream_gemini(build_contents(last_turns, message)):
+                        chunks.append(text)
+                        yield sse_event({"text": text})
+                    ai_response = "".join(chunks)
+                    if not ai_response:
+                        logger.warning("Empty model response (session %s)", request.session_id)
+                        yield sse_event({"error": EMPTY_RESPONSE_DETAIL})
+                        return
+                    if use_cache:
+                        await response_cache.put(message, embedding, ai_response)
+                
+                assistant_msg = ChatMessage(
+                    session_id=request.session_id,
+                    role="assistant",
+                    message=ai_response
+                )
+                await chat_log_writes.insert_many(
+                    [user_msg.model_dump(), assistant_msg.model_dump()],
+                    ordered=False,
+                    bypass_document_validation=True
+                )
+            
+            yield sse_event({"done": True, "session_id": request.session_id})
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            logger.exception("Chat stream error (session %s)", request.session_id)
+            yield sse_event({"error": f"Chat error: {str(e)}"})
+
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @api_router.get("/chat/history/{session_id}", response_model=List[ChatMessage])
-async def get_chat_history(session_id: str):
+async def get_chat_history(
+    session_id: str,
+    request: Request,
+    response: Response,
+    limit: int = Query(200, ge=1, le=1000)
+):
     try:
+        # Cheap version token so unchanged history is answered with a 304
+        count, latest = await asyncio.gather(
+            db.chat_messages.count_documents({"session_id": session_id}),
+            db.chat_messages.find_one(
+                {"session_id": session_id},
+                {"_id": 0, "timestamp": 1},
+                sort=CHAT_HISTORY_ORDER_DESC
+            )
+        )
+        etag = f'W/"{count}-{latest["timestamp"] if latest else 0}-{limit}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        
+        # Walk the index backwards to fetch only the most recent messages
         messages = await db.chat_messages.find(
             {"session_id": session_id},
-            {"_id": 0}
-        ).sort("timestamp", 1).to_list(1000)
-        
-        # Convert ISO string timestamps back to datetime objects
-        for msg in messages:
-            if isinstance(msg['timestamp'], str):
-                msg['timestamp'] = datetime.fromisoformat(msg['timestamp'])
-        
+            CHAT_MESSAGE_PROJECTION
+        ).sort(CHAT_HISTORY_ORDER_DESC).hint(CHAT_HISTORY_INDEX).to_list(limit)
+        messages.reverse()
         return messages
     except Exception as e:
-        logging.error(f"Error fetching history: {str(e)}")
+        logger.exception("Error fetching history (session %s)", session_id)
         raise HTTPException(status_code=500, detail=f"Error fetching history: {str(e)}")
 
+@api_router.get("/chat/history/{session_id}/stream")
+async def stream_chat_history(session_id: str):
+    # NDJSON, one message per line, decoded and sent a batch at a time
+    async def generate():
+        try:
+            cursor = db.chat_messages.find(
+                {"session_id": session_id},
+                CHAT_MESSAGE_PROJECTION
+            ).sort(CHAT_HISTORY_ORDER).hint(CHAT_HISTORY_INDEX).batch_size(100)
+            async for doc in cursor:
+                yield orjson.dumps(doc) + b"\n"
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            logger.exception("Error streaming history (session %s)", session_id)
+            yield orjson.dumps({"error": f"Error streaming history: {str(e)}"}) + b"\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 @api_router.delete("/chat/history/{session_id}")
 async def clear_chat_history(session_id: str):
     try:
         result = await db.chat_messages.delete_many({"session_id": session_id})
         return {"deleted_count": result.deleted_count, "session_id": session_id}
     except Exception as e:
-        logging.error(f"Error clearing history: {str(e)}")
+        logger.exception("Error clearing history (session %s)", session_id)
         raise HTTPException(status_code=500, detail=f"Error clearing history: {str(e)}")
 
 # Include the router in the main app
@@ -146,15 +415,34 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+@app.on_event("startup")
+async def ensure_indexes():
+    await db.chat_messages.create_index(CHAT_HISTORY_INDEX)
+
+@app.on_event("startup")
+async def start_session_lock_eviction():
+    app.state.session_lock_sweeper = asyncio.create_task(evict_idle_session_locks())
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    app.state.session_lock_sweeper.cancel()
+    client.close()
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # Session locks, the LLM concurrency cap and the semantic response cache
+    # are all per process. With WEB_CONCURRENCY > 1, turns of one session can
+    # run in parallel on different workers and LLM_CONCURRENCY applies to
+    # each worker separately, so the default stays at a single worker.
+    uvicorn.run(
+        "server:app",
+        host="0.0.0.0",
+        port=int(os.environ.get('PORT', '8000')),
+        workers=int(os.environ.get('WEB_CONCURRENCY', '1')),
+        loop="uvloop",
+        http="httptools"
+    )
@@ -1,4 +1,5 @@
-import requests
+import asyncio
+import httpx
 import sys
 import json
 from datetime import datetime
@@ -12,6 +13,19 @@ class LegalChatbotAPITester:
         self.tests_run = 0
         self.tests_passed = 0
         self.test_results = []
+        self._client = None
+
+    async def __aenter__(self):
+        # One pooled keep-alive client shared by every test
+        self._client = httpx.AsyncClient(
+            http2=True,
+            timeout=30,
+            limits=httpx.Limits(max_keepalive_connections=10)
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._client.aclose()
 
     def log_test(self, name, success, details=""):
         """Log test result"""
@@ -28,10 +42,10 @@ class LegalChatbotAPITester:
             "details": details
         })
 
-    def test_root_endpoint(self):
+    async def test_root_endpoint(self):
         """Test the root API endpoint"""
         try:
-            response = requests.get(f"{self.api_url}/", timeout=10)
+            response = await self._client.get(f"{self.api_url}/", timeout=10)
             success = response.status_code == 200
             details = f"Status: {response.status_code}"
             if success:
@@ -43,7 +57,7 @@ class LegalChatbotAPITester:
             self.log_test("Root API Endpoint", False, str(e))
             return False
 
-    def test_chat_endpoint(self):
+    async def test_chat_endpoint(self):
         """Test the chat endpoint with a consumer protection question"""
         try:
             test_message = "What are my rights if a product I bought is defective?"
@@ -53,7 +67,7 @@ class LegalChatbotAPITester:
             }
             
             print(f"🔍 Testing chat with message: '{test_message}'")
-            response = requests.post(
+            response = await self._client.post(
                 f"{self.api_url}/chat", 
                 json=payload, 
                 headers={'Content-Type': 'application/json'},
@@ -93,10 +107,10 @@ class LegalChatbotAPITester:
             self.log_test("Chat Endpoint", False, str(e))
             return False
 
-    def test_chat_history_endpoint(self):
+    async def test_chat_history_endpoint(self):
         """Test retrieving chat history"""
         try:
-            response = requests.get(f"{self.api_url}/chat/history/{self.session_id}", timeout=10)
+            response = await self._client.get(f"{self.api_url}/chat/history/{self.session_id}", timeout=10)
             success = response.status_code == 200
             details = f"Status: {response.status_code}"
             
@@ -124,10 +138,10 @@ class LegalChatbotAPITester:
             self.log_test("Chat History Endpoint", False, str(e))
             return False
 
-    def test_clear_chat_history(self):
+    async def test_clear_chat_history(self):
         """Test clearing chat history"""
         try:
-            response = requests.delete(f"{self.api_url}/chat/history/{self.session_id}", timeout=10)
+            response = await self._client.delete(f"{self.api_url}/chat/history/{self.session_id}", timeout=10)
             success = response.status_code == 200
             details = f"Status: {response.status_code}"
             
@@ -151,8 +165,8 @@ class LegalChatbotAPITester:
             self.log_test("Clear Chat History", False, str(e))
             return False
 
-    def test_multiple_chat_messages(self):
-        """Test sending multiple messages in sequence"""
+    async def test_multiple_chat_messages(self):
+        """Test sending multiple messages concurrently, one session each"""
         try:
             messages = [
                 "How do I return a faulty product?",
@@ -160,25 +174,28 @@ class LegalChatbotAPITester:
                 "Can I get a refund for digital purchases?"
             ]
             
-            all_success = True
-            for i, message in enumerate(messages):
-                payload = {
-                    "session_id": self.session_id,
-                    "message": message
-                }
-                
-                response = requests.post(
-                    f"{self.api_url}/chat", 
-                    json=payload, 
-                    headers={'Content-Type': 'application/json'},
-                    timeout=30
+            responses = await asyncio.gather(*[
+                self._client.post(
+                    f"{self.api_url}/chat",
+                    json={"session_id": f"{self.session_id}_{i}", "message": message},
+                    headers={'Content-Type': 'application/json'}
                 )
-                
+                for i, message in enumerate(messages)
+            ])
+            
+            all_success = True
+            for i, response in enumerate(responses):
                 if response.status_code != 200:
                     all_success = False
-                    break
-                    
-                print(f"✅ Message {i+1}/3 sent successfully")
+                    print(f"❌ Message {i+1}/{len(messages)} failed with status {response.status_code}")
+                else:
+                    print(f"✅ Message {i+1}/{len(messages)} sent successfully")
+            
+            # These throwaway sessions are not covered by test_clear_chat_history
+            await asyncio.gather(*[
+                self._client.delete(f"{self.api_url}/chat/history/{self.session_id}_{i}")
+                for i in range(len(messages))
+            ])
             
             details = f"Sent {len(messages)} messages"
             self.log_test("Multiple Chat Messages", all_success, details)
@@ -187,7 +204,194 @@ class LegalChatbotAPITester:
             self.log_test("Multiple Chat Messages", False, str(e))
             return False
 
-    def run_all_tests(self):
+    async def test_follow_up_message(self):
+        """Test a sequential follow-up in the same session keeps turns in order"""
+        try:
+            response = await self._client.post(
+                f"{self.api_url}/chat",
+                json={"session_id": self.session_id, "message": "How long do I have to ask for a refund?"},
+                headers={'Content-Type': 'application/json'}
+            )
+            success = response.status_code == 200
+            details = f"Status: {response.status_code}"
+            
+            if success:
+                history = await self._client.get(f"{self.api_url}/chat/history/{self.session_id}")
+                data = history.json()
+                roles = [m['role'] for m in data]
+                details += f", Roles: {roles}"
+                if roles != ["user", "assistant", "user", "assistant"]:
+                    success = False
+                    details += ", Expected 4 alternating user/assistant messages"
+            
+            self.log_test("Follow-up Message", success, details)
+            return success
+        except Exception as e:
+            self.log_test("Follow-up Message", False, str(e))
+            return False
+
+    async def test_chat_history_etag(self):
+        """Test unchanged history is answered with a 304 and a new message changes the ETag"""
+        try:
+            history_url = f"{self.api_url}/chat/history/{self.session_id}"
+            response = await self._client.get(history_url)
+            etag = response.headers.get('etag')
+            success = response.status_code == 200 and etag is not None
+            details = f"Status: {response.status_code}, ETag: {etag}"
+            
+            if success:
+                cached = await self._client.get(history_url, headers={'If-None-Match': etag})
+                details += f", Revalidation status: {cached.status_code}"
+                if cached.status_code != 304:
+                    success = False
+            
+            if success:
+                await self._client.post(
+                    f"{self.api_url}/chat",
+                    json={"session_id": self.session_id, "message": "Does this also apply to online orders?"},
+                    headers={'Content-Type': 'application/json'}
+                )
+                changed = await self._client.get(history_url, headers={'If-None-Match': etag})
+                new_etag = changed.headers.get('etag')
+                details += f", After new message: {changed.status_code} {new_etag}"
+                if changed.status_code != 200 or new_etag == etag:
+                    success = False
+            
+            self.log_test("Chat History ETag", success, details)
+            return success
+        except Exception as e:
+            self.log_test("Chat History ETag", False, str(e))
+            return False
+
+    async def test_message_validation(self):
+        """Test blank and oversized messages are rejected before reaching the model"""
+        try:
+            blank = await self._client.post(
+                f"{self.api_url}/chat",
+                json={"session_id": self.session_id, "message": "   \n\t "},
+                headers={'Content-Type': 'application/json'}
+            )
+            oversized = await self._client.post(
+                f"{self.api_url}/chat",
+                json={"session_id": self.session_id, "message": "a" * 8001},
+                headers={'Content-Type': 'application/json'}
+            )
+            success = blank.status_code == 422 and oversized.status_code == 413
+            details = f"Blank: {blank.status_code}, Oversized: {oversized.status_code}"
+            self.log_test("Message Validation", success, details)
+            return success
+        except Exception as e:
+            self.log_test("Message Validation", False, str(e))
+            return False
+
+    async def test_repeated_question(self):
+        """Test asking the same question twice in a row returns the previous answer"""
+        session_id = f"{self.session_id}_repeat"
+        try:
+            payload = {"session_id": session_id, "message": "Can a shop refuse to refund a sale item?"}
+            first = await self._client.post(
+                f"{self.api_url}/chat",
+                json=payload,
+                headers={'Content-Type': 'application/json'}
+            )
+            second = await self._client.post(
+                f"{self.api_url}/chat",
+                json=payload,
+                headers={'Content-Type': 'application/json'}
+            )
+            success = first.status_code == 200 and second.status_code == 200
+            details = f"Status: {first.status_code}, {second.status_code}"
+            
+            if success and first.json()['response'] != second.json()['response']:
+                success = False
+                details += ", Repeated question got a different answer"
+            
+            self.log_test("Repeated Question", success, details)
+            return success
+        except Exception as e:
+            self.log_test("Repeated Question", False, str(e))
+            return False
+        finally:
+            await self._client.delete(f"{self.api_url}/chat/history/{session_id}")
+
+    async def test_chat_stream_endpoint(self):
+        """Test the SSE chat stream delivers text events and ends with a done event"""
+        try:
+            chunks = []
+            done = None
+            error = None
+            async with self._client.stream(
+                "POST",
+                f"{self.api_url}/chat/stream",
+                json={"session_id": self.session_id, "message": "What should I do if a seller ignores my complaint?"},
+                headers={'Content-Type': 'application/json'}
+            ) as response:
+                success = response.status_code == 200
+                details = f"Status: {response.status_code}"
+                if success:
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data: "):
+                            continue
+                        event = json.loads(line[len("data: "):])
+                        if 'error' in event:
+                            error = event['error']
+                            break
+                        if event.get('done'):
+                            done = event
+                            break
+                        chunks.append(event.get('text', ''))
+            
+            if success:
+                details += f", Text events: {len(chunks)}, Response length: {len(''.join(chunks))} chars"
+                if error is not None:
+                    success = False
+                    details += f", Error event: {error}"
+                elif done is None or done.get('session_id') != self.session_id:
+                    success = False
+                    details += ", Missing done event"
+                elif not ''.join(chunks):
+                    success = False
+                    details += ", No text received"
+            
+            self.log_test("Chat Stream Endpoint", success, details)
+            return success
+        except Exception as e:
+            self.log_test("Chat Stream Endpoint", False, str(e))
+            return False
+
+    async def test_chat_history_stream(self):
+        """Test the NDJSON history stream returns the session's messages in order"""
+        try:
+            messages = []
+            async with self._client.stream(
+                "GET",
+                f"{self.api_url}/chat/history/{self.session_id}/stream"
+            ) as response:
+                success = response.status_code == 200
+                details = f"Status: {response.status_code}"
+                if success:
+                    async for line in response.aiter_lines():
+                        if line.strip():
+                            messages.append(json.loads(line))
+            
+            if success:
+                details += f", Lines: {len(messages)}"
+                errors = [m['error'] for m in messages if 'error' in m]
+                roles = [m.get('role') for m in messages]
+                if errors:
+                    success = False
+                    details += f", Error line: {errors[0]}"
+                elif not messages or roles != ["user", "assistant"] * (len(roles) // 2):
+                    success = False
+                    details += ", Expected alternating user/assistant messages"
+            
+            self.log_test("Chat History Stream", success, details)
+            return success
+        except Exception as e:
+            self.log_test("Chat History Stream", False, str(e))
+            return False
+
+    async def run_all_tests(self):
         """Run all backend API tests"""
         print("🚀 Starting Legal Chatbot Backend API Tests")
         print(f"📍 Testing against: {self.base_url}")
@@ -195,11 +399,17 @@ class LegalChatbotAPITester:
         print("=" * 60)
         
         # Test sequence
-        self.test_root_endpoint()
-        self.test_chat_endpoint()
-        self.test_chat_history_endpoint()
-        self.test_multiple_chat_messages()
-        self.test_clear_chat_history()
+        await self.test_root_endpoint()
+        await self.test_chat_endpoint()
+        await self.test_chat_history_endpoint()
+        await self.test_follow_up_message()
+        await self.test_chat_history_etag()
+        await self.test_message_validation()
+        await self.test_repeated_question()
+        await self.test_chat_stream_endpoint()
+        await self.test_chat_history_stream()
+        await self.test_multiple_chat_messages()
+        await self.test_clear_chat_history()
         
         # Final results
         print("=" * 60)
@@ -217,9 +427,9 @@ class LegalChatbotAPITester:
             print("⚠️  Some backend tests failed!")
             return 1
 
-def main():
-    tester = LegalChatbotAPITester()
-    return tester.run_all_tests()
+async def main():
+    async with LegalChatbotAPITester() as tester:
+        return await tester.run_all_tests()
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(asyncio.run(main()))
\ No newline at end of file
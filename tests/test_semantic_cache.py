@@ -0,0 +1,86 @@
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from semantic_cache import SemanticCache  # noqa: E402
+
+
+VECTORS = {
+    "can i return a faulty phone": [1.0, 0.0, 0.0],
+    "how do i return a faulty phone": [0.99, 0.05, 0.0],
+    "what is a tenancy deposit": [0.0, 1.0, 0.0],
+    "how long is a warranty": [0.0, 0.0, 1.0],
+}
+
+
+class StubEmbed:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, text):
+        self.calls.append(text)
+        return VECTORS.get(text.lower(), [0.5, 0.5, 0.5])
+
+
+class SemanticCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.embed = StubEmbed()
+        self.cache = SemanticCache(embed=self.embed, threshold=0.95, max_entries=2)
+
+    def store(self, text, response):
+        async def run():
+            hit, embedding = await self.cache.lookup(text)
+            self.assertIsNone(hit)
+            await self.cache.put(text, embedding, response)
+        asyncio.run(run())
+
+    def lookup(self, text):
+        return asyncio.run(self.cache.lookup(text))[0]
+
+    def test_exact_hit_ignores_case_and_whitespace(self):
+        self.store("Can I return a faulty phone", "Yes, within 30 days.")
+        calls = len(self.embed.calls)
+
+        self.assertEqual(self.lookup("  can i  RETURN a faulty phone "), "Yes, within 30 days.")
+        self.assertEqual(len(self.embed.calls), calls)
+
+    def test_semantic_hit(self):
+        self.store("Can I return a faulty phone", "Yes, within 30 days.")
+
+        self.assertEqual(self.lookup("How do I return a faulty phone"), "Yes, within 30 days.")
+
+    def test_miss(self):
+        self.store("Can I return a faulty phone", "Yes, within 30 days.")
+
+        self.assertIsNone(self.lookup("What is a tenancy deposit"))
+
+    def test_long_prompt_skips_semantic_match(self):
+        self.cache.max_semantic_chars = 10
+        self.store("Can I return a faulty phone", "Yes, within 30 days.")
+        calls = len(self.embed.calls)
+
+        self.assertIsNone(self.lookup("How do I return a faulty phone"))
+        self.assertEqual(len(self.embed.calls), calls)
+
+    def test_empty_response_is_not_stored(self):
+        self.store("Can I return a faulty phone", "")
+
+        self.assertEqual(len(self.cache), 0)
+
+    def test_oldest_entry_is_evicted(self):
+        self.store("Can I return a faulty phone", "Yes, within 30 days.")
+        self.store("What is a tenancy deposit", "Money held against damage.")
+        self.store("How long is a warranty", "Usually one year.")
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.lookup("Can I return a faulty phone"))
+        self.assertIsNone(self.lookup("How do I return a faulty phone"))
+        self.assertEqual(self.lookup("What is a tenancy deposit"), "Money held against damage.")
+        self.assertEqual(self.lookup("How long is a warranty"), "Usually one year.")
+
+
+if __name__ == "__main__":
+    unittest.main()